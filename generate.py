@@ -17,10 +17,11 @@ Key Features:
 - Supports custom adapters for array pointers, modifiable output parameters, and shared pointer returns.
 - Allows per-module configuration for pointer types, nullable parameters, enum/class/function exclusions, and macro defines.
 - Can process a single YAML file or recursively process all generate.yaml files in a directory.
+- Skips modules whose output is newer than all of their inputs, unless --force is given.
 
 Usage:
 ------
-    python generate.py <config_yaml_path> [--dump-srcml]
+    python generate.py <config_yaml_path> [--dump-srcml] [--force]
 
 Note:
 -----
@@ -28,18 +29,127 @@ Note:
 """
 
 import argparse
+import concurrent.futures
+import copy
+import functools
 import srcmlcpp
 import litgen
 from codemanip import code_utils
 import yaml
+import litgen_extensions
 from litgen_extensions import *
 import os
 import glob
 
+try:
+    from yaml import CSafeLoader
+except ImportError:
+    from yaml import SafeLoader as CSafeLoader
+
+# Preprocessor regions that srcmlcpp keeps: __cplusplus, header guards, and SWIG.
+# Same matches as "__cplusplus|_h_$|_h$|_H$|_H_$|hpp$|HPP$|hxx$|HXX$|SWIG$", with the anchored
+# suffixes factored into a single group. It stays a string: srcmlcpp caches the compiled pattern.
+_HEADER_FILTER_ACCEPTABLE__REGEX = r"__cplusplus|(?:_[hH]_?|hpp|HPP|hxx|HXX|SWIG)$"
+
+# Directories which never hold a generate.yaml, so _find_config_yamls does not descend into them
+_SKIPPED_DIRS = frozenset(["build", "node_modules", "__pycache__"])
+
+
+@functools.lru_cache(maxsize=100)
+def _parse_yaml_cached(path, mtime_ns, size):
+    # mtime_ns and size are only part of the cache key, so that an edited file is re-parsed
+    with open(path, "r") as yaml_file:
+        return yaml.load(yaml_file, Loader=CSafeLoader)
+
+
+def _load_yaml(path):
+    # Only saves work when the same unchanged file is loaded again in this process. Every caller
+    # gets its own copy, so that none of them can modify the cached parse.
+    stat = os.stat(path)
+    return copy.deepcopy(_parse_yaml_cached(os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
 
-def generate(config_yaml_path, dump_srcml=False):
-    print(f"generating from {config_yaml_path}")
 
+def _load_config_object(config_yaml_path):
+    # Returns the modules: section of a generate.yaml and the list of problems found in it
+    config = _load_yaml(config_yaml_path)
+    config_object = config.get("modules", []) if isinstance(config, dict) else None
+    if not config_object:
+        return None, ["modules: section not found"]
+    return config_object, validate_config_object(config_object)
+
+
+def _generator_sources():
+    # The output also depends on this script and on our litgen extensions
+    extensions_dir = os.path.dirname(litgen_extensions.__file__)
+    return [os.path.abspath(__file__)] + glob.glob(os.path.join(extensions_dir, "*.py"))
+
+
+def _is_up_to_date(output_path, input_paths):
+    try:
+        output_mtime = os.path.getmtime(output_path)
+    except FileNotFoundError:
+        return False
+    return max(os.path.getmtime(input_path) for input_path in input_paths) < output_mtime
+
+
+def _read_headers(header_paths):
+    for file_path in header_paths:
+        with open(file_path, "r", buffering=1 << 20) as file:
+            yield file.read()
+        yield "\n"
+
+
+def _generate_module(module, options, dump_srcml):
+    # litgen and srcmlcpp only accept the code as one string, but joining from a generator
+    # means the individual header contents are released as soon as it is built, instead of
+    # being kept alive next to it for the whole code generation
+    source_code = "".join(_read_headers(module["headers"]))
+
+    if dump_srcml:
+        srcmlcpp_options = options.srcmlcpp_options
+        cpp_unit = srcmlcpp.code_to_cpp_unit(srcmlcpp_options, source_code)
+        with open(f'{module["path"]}.xml', "w") as file:
+            file.write(cpp_unit.str_code())
+        return None
+
+    generated_code = litgen.generate_code(options, source_code)
+
+    if "path" in module:
+        # Write next to the output and swap it in, so that build tools never read a half-written file
+        tmp_path = f'{module["path"]}.tmp'
+        with open(tmp_path, "w", buffering=1 << 20) as file:
+            file.write(generated_code.glue_code + generated_code.pydef_code)
+        os.replace(tmp_path, module["path"])
+        # Not sure how we would combine generated and custom code for stubs
+        # with open(f'{module["path"]}.pyi', 'w') as file:
+        #   file.write(generated_code.stub_code)
+        return None
+
+    # Without an output path the code is printed by the parent process, in module order
+    return generated_code
+
+
+def _find_config_yamls(root):
+    # os.scandir entries cache their file type, so unlike glob this needs no extra stat calls.
+    # Hidden directories are skipped, as glob's ** does.
+    try:
+        entries = os.scandir(root)
+    except OSError:
+        # Like glob, silently skip directories that cannot be read
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.name.startswith(".") and entry.name not in _SKIPPED_DIRS:
+                    yield from _find_config_yamls(entry.path)
+            elif entry.name == "generate.yaml" and entry.is_file():
+                yield entry.path
+
+
+def build_base_options():
+    """
+    Builds the litgen options shared by every module, before any generate.yaml is applied.
+    """
     options = litgen.LitgenOptions()
     options.bind_library = litgen.BindLibraryType.nanobind
     options.python_run_black_formatter = True
@@ -64,6 +174,9 @@ def generate(config_yaml_path, dump_srcml=False):
         "SUNProfiler",
         "SUNStepper",
     ]
+    # The adapters only test membership, so give them a set to look into. It must be kept in sync
+    # whenever sundials_pointer_types is extended.
+    options.sundials_pointer_types_set = frozenset(options.sundials_pointer_types)
 
     # Don't capture comments from the source for generating Python doc strings
     options.comments_exclude = False
@@ -77,6 +190,9 @@ def generate(config_yaml_path, dump_srcml=False):
     # Allow const char to be nullable
     options.fn_params_const_char_pointer_with_default_null = True
 
+    # Maps function names to their nullable pointer params, these come from the generate.yaml files
+    options.fn_params_optional_with_default_null = {}
+
     # Transform inplace modification of values, e.g. int CVodeGetNumSteps(void* cvode_mem, long int* num_steps), to CvodeGetNumSteps(cvode_mem) -> Tuple[int, long int]
     # Litgen original option is fn_params_output_modifiable_immutable_to_return__regex, but we use fn_params_output_modifiable_immutable_to_return__regex_custom
     # since we override the adapt_modifiable_immutable_to_return function adapter
@@ -108,70 +224,84 @@ def generate(config_yaml_path, dump_srcml=False):
         'A cpp element of type "function_decl" was stored as CppUnprocessed'
     )
     options.srcmlcpp_options.header_filter_preprocess_regions = True
-    options.srcmlcpp_options.header_filter_acceptable__regex = (
-        "__cplusplus|_h_$|_h$|_H$|_H_$|hpp$|HPP$|hxx$|HXX$|SWIG$"
-    )
+    options.srcmlcpp_options.header_filter_acceptable__regex = _HEADER_FILTER_ACCEPTABLE__REGEX
+
+    return options
 
-    with open(config_yaml_path, "r") as yaml_file:
-        config_object = yaml.safe_load(yaml_file).get("modules", [])
-    if not config_object:
-        raise RuntimeError(f"modules: section not found in {config_yaml_path}")
 
+def generate(config_yaml_path, dump_srcml=False, base_options=None, force=False):
+    print(f"generating from {config_yaml_path}")
+
+    if base_options is None:
+        base_options = build_base_options()
+
+    # Only the per-module fields below are changed. They are all reassigned, except for
+    # sundials_pointer_types which is extended in place, so it gets its own list.
+    options = copy.copy(base_options)
+    options.sundials_pointer_types = list(base_options.sundials_pointer_types)
+
+    config_object, errors = _load_config_object(config_yaml_path)
+    if errors:
+        raise RuntimeError(f"invalid config {config_yaml_path}:\n  " + "\n  ".join(errors))
+
+    generator_sources = _generator_sources()
+
+    jobs = []
     for module_name in config_object:
         if module_name == "all":
             continue
 
         module = config_object.get(module_name)
 
-        options.sundials_pointer_types.extend(
-            load_pointer_types_from_yaml(config_object, module_name)
-        )
-
-        options.fn_params_optional_with_default_null = load_nullable_params_from_yaml(
-            config_object, module_name
-        )
-
-        options.enum_exclude_by_name__regex = code_utils.join_string_by_pipe_char(
-            load_enum_exclusions_from_yaml(config_object, module_name)
-        )
-
-        options.class_exclude_by_name__regex = code_utils.join_string_by_pipe_char(
-            load_class_exclusions_from_yaml(config_object, module_name)
-        )
-
-        options.fn_exclude_by_name__regex = code_utils.join_string_by_pipe_char(
-            load_fn_exclusions_from_yaml(config_object, module_name)
-        )
-
-        options.macro_define_include_by_name__regex = code_utils.join_string_by_pipe_char(
-            load_macro_defines_from_yaml(config_object, module_name)
-        )
-
-        source_code = ""
-        for file_path in module["headers"]:
-            with open(file_path, "r") as file:
-                source_code = source_code + file.read()
-            source_code = source_code + "\n"
-
-        if dump_srcml:
-            srcmlcpp_options = options.srcmlcpp_options
-            cpp_unit = srcmlcpp.code_to_cpp_unit(srcmlcpp_options, source_code)
-            with open(f'{module["path"]}.xml', "w") as file:
-                file.write(cpp_unit.str_code())
+        module_opts = load_module_opts_from_yaml(config_object, module_name)
+
+        options.sundials_pointer_types.extend(module_opts["sundials_pointer_types"])
+        options.sundials_pointer_types_set = frozenset(options.sundials_pointer_types)
+
+        options.fn_params_optional_with_default_null = module_opts[
+            "fn_params_optional_with_default_null"
+        ]
+
+        for opt in (
+            "enum_exclude_by_name__regex",
+            "class_exclude_by_name__regex",
+            "fn_exclude_by_name__regex",
+            "macro_define_include_by_name__regex",
+        ):
+            setattr(options, opt, code_utils.join_string_by_pipe_char(module_opts[opt]))
+
+        # Skip modules whose output is newer than all of their inputs. This comes after the options
+        # update above, since the pointer types of a module carry over to the next modules.
+        if (
+            not force
+            and not dump_srcml
+            and "path" in module
+            and _is_up_to_date(
+                module["path"], [*module["headers"], config_yaml_path, *generator_sources]
+            )
+        ):
+            print(f"{module['path']} is up to date")
             continue
 
-        generated_code = litgen.generate_code(options, source_code)
+        # Snapshot the options, they keep being modified for the next modules
+        jobs.append((module, copy.deepcopy(options)))
 
-        if "path" in module:
-            with open(module["path"], "w") as file:
-                file.write(generated_code.glue_code)
-                file.write(generated_code.pydef_code)
-            # Not sure how we would combine generated and custom code for stubs
-            # with open(f'{module["path"]}.pyi', 'w') as file:
-            #   file.write(generated_code.stub_code)
-        else:
-            print(generated_code.glue_code)
-            print(generated_code.pydef_code)
+    if not jobs:
+        return
+
+    # Each module is independent (own headers, own output path) so they are generated in parallel
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(len(jobs), os.cpu_count() or 1)
+    ) as executor:
+        futures = [
+            executor.submit(_generate_module, module, module_options, dump_srcml)
+            for module, module_options in jobs
+        ]
+        for future in futures:
+            generated_code = future.result()
+            if generated_code is not None:
+                print(generated_code.glue_code)
+                print(generated_code.pydef_code)
 
 
 def main():
@@ -184,13 +314,16 @@ def main():
         action="store_true",
         help="Dump the srcML XML for the parsed headers and exit",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Regenerate every module, even those whose output is newer than all of its inputs",
+    )
     args = parser.parse_args()
 
     config_yaml_paths = []
     if os.path.isdir(args.config_yaml_path):
-        config_yaml_paths = glob.glob(
-            os.path.join(args.config_yaml_path, "**", "generate.yaml"), recursive=True
-        )
+        config_yaml_paths = list(_find_config_yamls(args.config_yaml_path))
         if not config_yaml_paths:
             raise RuntimeError(
                 f"No generate.yaml files found in directory {args.config_yaml_path}"
@@ -198,8 +331,17 @@ def main():
     else:
         config_yaml_paths = [args.config_yaml_path]
 
+    # Check every config before generating anything, so that a broken generate.yaml aborts a
+    # directory run before any header is read, instead of after the earlier configs are done
+    errors = []
+    for path in config_yaml_paths:
+        errors.extend(f"{path}: {error}" for error in _load_config_object(path)[1])
+    if errors:
+        raise RuntimeError("invalid generate.yaml configs:\n  " + "\n  ".join(errors))
+
+    base_options = build_base_options()
     for path in config_yaml_paths:
-        generate(path, args.dump_srcml)
+        generate(path, args.dump_srcml, base_options, args.force)
 
 
 if __name__ == "__main__":
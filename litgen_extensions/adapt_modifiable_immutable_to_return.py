@@ -68,7 +68,7 @@ def adapt_modifiable_immutable_to_return(
         a = param.is_modifiable_python_immutable_ref_or_pointer()
         b = (
             param.cpp_element().decl.cpp_type.name_without_modifier_specifier()
-            in options.sundials_pointer_types
+            in options.sundials_pointer_types_set
         )
         c = param.cpp_element().decl.cpp_type.modifiers == ["*"]
         if a or (b and c):
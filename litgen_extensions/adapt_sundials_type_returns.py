@@ -1,12 +1,20 @@
 import copy
 import re
 from typing import Optional
-from codemanip import code_utils
 from srcmlcpp.cpp_types import CppParameter  # noqa: F401 (used for type hints only)
 from litgen.internal.adapt_function_params._lambda_adapter import LambdaAdapter
 from litgen.internal.adapted_types import AdaptedFunction
 from .utils import is_array_param
 
+_TUPLE_RE = re.compile(r"std::tuple\s*<(.+?)>")
+
+
+def _make_shared_code(pointer_type: str, value: str) -> str:
+    # C++ expression wrapping a SUNDIALS pointer into a shared_ptr with its deleter
+    return (
+        f"our_make_shared<std::remove_pointer_t<{pointer_type}>, {pointer_type}Deleter>({value})"
+    )
+
 
 def adapt_sundials_types_returns_to_shared_ptr(
     adapted_function: AdaptedFunction,
@@ -16,30 +24,35 @@ def adapt_sundials_types_returns_to_shared_ptr(
     std::vector<pointer_type> in the Python interface. Handles multiple such parameters in one function.
     """
     options = adapted_function.options
-    sundials_pointer_types = options.sundials_pointer_types
+    sundials_pointer_types = options.sundials_pointer_types_set
     return_type = adapted_function.cpp_adapted_function.return_type
+    cpp_element_comments = adapted_function.cpp_element().cpp_element_comments
 
     needs_adapt = False
     is_tuple = False
-    return_type_str = return_type.str_return_type()
 
     # print(f"{adapted_function.cpp_element().function_name}")
     # print(f"    {adapted_function.cpp_element()}")
     # print(f"    {adapted_function.cpp_element().cpp_element_comments}")
 
-    if (
-        "nb::rv_policy::reference"
-        in adapted_function.cpp_element().cpp_element_comments.comments_as_str()
+    # Most functions return void, int, SUNErrCode, etc.: rule them out from the typenames alone
+    # before building the return type string
+    if not any(
+        typename in sundials_pointer_types or typename.startswith("std::tuple")
+        for typename in return_type.typenames
     ):
         return None
 
-    tuple_args_match = None
+    if "nb::rv_policy::reference" in cpp_element_comments.comments_as_str():
+        return None
+
+    return_type_str = return_type.str_return_type()
+
     tuple_args_list = None
-    if return_type_str.startswith("std::tuple"):
-        tuple_args_match = re.match(r"std::tuple\s*<(.+?)>", return_type_str)
-        if tuple_args_match:
-            tuple_args_list = [arg.strip() for arg in tuple_args_match.group(1).split(",")]
-            needs_adapt = any(arg in sundials_pointer_types for arg in tuple_args_list)
+    tuple_args_match = _TUPLE_RE.match(return_type_str)
+    if tuple_args_match is not None:
+        tuple_args_list = [arg.strip() for arg in tuple_args_match.group(1).split(",")]
+        needs_adapt = any(arg in sundials_pointer_types for arg in tuple_args_list)
         is_tuple = True
     elif return_type_str in sundials_pointer_types:
         needs_adapt = True
@@ -47,6 +60,17 @@ def adapt_sundials_types_returns_to_shared_ptr(
     if not needs_adapt:
         return None
 
+    # Resolve each parameter's declaration once, it is needed both to find the SUNContext
+    # and to forward the parameters to the adapted function
+    param_decls = [param.cpp_element().decl for param in adapted_function.adapted_parameters()]
+
+    # Index of the SUNContext parameter, which the returned objects must keep alive
+    suncontext_idx = None
+    for idx, param_decl in enumerate(param_decls):
+        if "SUNContext" in param_decl.cpp_type.typenames:
+            suncontext_idx = idx
+            break
+
     lambda_adapter = LambdaAdapter()
     if is_tuple:
         idx_nurse_list = [
@@ -54,21 +78,16 @@ def adapt_sundials_types_returns_to_shared_ptr(
         ]
 
         idx_nurse_args = ", ".join(str(idx_nurse) for idx_nurse in idx_nurse_list)
-        suncontext_typename = "SUNContext"
-        for idx, param in enumerate(adapted_function.adapted_parameters()):
-            # Cache attribute lookup
-            typenames = param.cpp_element().decl.cpp_type.typenames
-            if suncontext_typename in typenames:
-                adapted_function.cpp_element().cpp_element_comments.add_eol_comment(
-                    f"nb::call_policy<sundials4py::returns_references_to<{idx+1}, {idx_nurse_args}>>()"
-                )
-
-        # Only deepcopy if mutation is required
-        lambda_adapter.new_function_infos = copy.deepcopy(adapted_function.cpp_adapted_function)
-        old_function_params = adapted_function.adapted_parameters()
-        new_function_params = old_function_params
+        if suncontext_idx is not None:
+            cpp_element_comments.add_eol_comment(
+                f"nb::call_policy<sundials4py::returns_references_to<{suncontext_idx+1}, {idx_nurse_args}>>()"
+            )
+
+        # Only the return type is replaced, so a shallow copy sharing the parameters is enough
+        lambda_adapter.new_function_infos = copy.copy(adapted_function.cpp_adapted_function)
         old_return_type = adapted_function.cpp_adapted_function.return_type
-        new_return_type = copy.deepcopy(old_return_type)
+        # A shallow copy suffices since every field we change is reassigned, not mutated
+        new_return_type = copy.copy(old_return_type)
         new_return_type.modifiers = []
         new_return_type.specifiers = []
 
@@ -88,23 +107,22 @@ def adapt_sundials_types_returns_to_shared_ptr(
         lambda_adapter.new_function_infos.return_type = new_return_type
 
         # Build the return statement, wrapping only the relevant tuple elements
-        tuple_parts = []
-        for i, arg in enumerate(tuple_args_list):
-            if i in idx_nurse_list:
-                tuple_parts.append(
-                    f"our_make_shared<std::remove_pointer_t<{arg}>, {arg}Deleter>"
-                    f"(std::get<{i}>(lambda_result))"
-                )
-            else:
-                tuple_parts.append(f"std::get<{i}>(lambda_result)")
-        lambda_output_code = "return std::make_tuple(" + ", ".join(tuple_parts) + ");"
-
-        lambda_adapter.lambda_output_code += (
-            code_utils.unindent_code(lambda_output_code, flag_strip_empty_lines=True) + "\n"
-        )
+        idx_nurse_set = set(idx_nurse_list)
+        tuple_parts = [
+            (
+                _make_shared_code(arg, f"std::get<{i}>(lambda_result)")
+                if i in idx_nurse_set
+                else f"std::get<{i}>(lambda_result)"
+            )
+            for i, arg in enumerate(tuple_args_list)
+        ]
+        lambda_output_code = f"return std::make_tuple({', '.join(tuple_parts)});"
+
+        # Built on a single unindented line, so there is nothing for unindent_code to do
+        lambda_adapter.lambda_output_code += lambda_output_code + "\n"
 
         lambda_adapter.adapted_cpp_parameter_list.extend(
-            param.cpp_element().decl.decl_name for param in new_function_params
+            param_decl.decl_name for param_decl in param_decls
         )
 
         lambda_adapter.lambda_name = f"{adapted_function.cpp_adapted_function.function_name}_adapt_return_type_to_shared_ptr"
@@ -112,38 +130,28 @@ def adapt_sundials_types_returns_to_shared_ptr(
         # Ensure SUNContext is kept alive while this object is alive
         # The easiest way to do this without modifying litgen is to inject the
         # keep_alive statement as a comment.
-        suncontext_typename = "SUNContext"
-        for idx, param in enumerate(adapted_function.adapted_parameters()):
-            typenames = param.cpp_element().decl.cpp_type.typenames
-            if suncontext_typename in typenames:
-                adapted_function.cpp_element().cpp_element_comments.add_eol_comment(
-                    f"nb::keep_alive<0, {idx+1}>()"
-                )
-
-        # Only deepcopy if mutation is required
+        if suncontext_idx is not None:
+            cpp_element_comments.add_eol_comment(f"nb::keep_alive<0, {suncontext_idx+1}>()")
+
+        # Only the return type is replaced, so a shallow copy sharing the parameters is enough
         lambda_adapter = LambdaAdapter()
-        lambda_adapter.new_function_infos = copy.deepcopy(adapted_function.cpp_adapted_function)
-        old_function_params = adapted_function.adapted_parameters()
-        new_function_params = old_function_params
+        lambda_adapter.new_function_infos = copy.copy(adapted_function.cpp_adapted_function)
         old_return_type = adapted_function.cpp_adapted_function.return_type
 
-        new_return_type = copy.deepcopy(old_return_type)
+        # A shallow copy suffices since every field we change is reassigned, not mutated
+        new_return_type = copy.copy(old_return_type)
         new_return_type.modifiers = []
         new_return_type.specifiers = []
         new_return_type.typenames = [f"std::shared_ptr<std::remove_pointer_t<{old_return_type}>>"]
         lambda_adapter.new_function_infos.return_type = new_return_type
 
-        lambda_output_code = (
-            f"return our_make_shared<std::remove_pointer_t<{str(old_return_type)}>, "
-            f"{str(old_return_type)}Deleter>(lambda_result);"
-        )
+        lambda_output_code = f"return {_make_shared_code(str(old_return_type), 'lambda_result')};"
 
-        lambda_adapter.lambda_output_code += (
-            code_utils.unindent_code(lambda_output_code, flag_strip_empty_lines=True) + "\n"
-        )
+        # Built on a single unindented line, so there is nothing for unindent_code to do
+        lambda_adapter.lambda_output_code += lambda_output_code + "\n"
 
         lambda_adapter.adapted_cpp_parameter_list.extend(
-            param.cpp_element().decl.decl_name for param in new_function_params
+            param_decl.decl_name for param_decl in param_decls
         )
 
         lambda_adapter.lambda_name = f"{adapted_function.cpp_adapted_function.function_name}_adapt_return_type_to_shared_ptr"
@@ -7,7 +7,7 @@ from srcmlcpp.cpp_types import CppPublicProtectedPrivate
 def ensure_return_policy_reference_for_pointers(func: AdaptedFunction) -> None:
     options = func.options
 
-    pointer_types = options.sundials_pointer_types
+    pointer_types = options.sundials_pointer_types_set
 
     if not func.return_value_policy:
         if str(func.cpp_adapted_function.return_type) in pointer_types:
@@ -1,5 +1,6 @@
 import litgen
 from litgen.internal.adapted_types import AdaptedFunction, AdaptedParameter
+import os
 import re
 
 
@@ -59,6 +60,96 @@ def load_pointer_types_from_yaml(config_object, module):
     return opt_list
 
 
+# Options that a generate.yaml module (or the "all" section) can extend with a list of values
+_LIST_OPTS_FROM_YAML = (
+    "sundials_pointer_types",
+    "enum_exclude_by_name__regex",
+    "class_exclude_by_name__regex",
+    "fn_exclude_by_name__regex",
+    "macro_define_include_by_name__regex",
+)
+
+
+def load_module_opts_from_yaml(config_object, module):
+    """
+    Loads every per-module option in a single pass over the "all" and module sections, with the
+    same merging as the individual load_*_from_yaml functions. Returns a dict keyed by option name.
+    """
+    opts = {opt: [] for opt in _LIST_OPTS_FROM_YAML}
+    nullable_opt = "fn_params_optional_with_default_null"
+    opts[nullable_opt] = {}
+    for section_name in ("all", module):
+        section = config_object.get(section_name, {})
+        if not section:
+            continue
+        for opt in _LIST_OPTS_FROM_YAML:
+            opts[opt].extend(section.get(opt, []))
+        opts[nullable_opt] = opts[nullable_opt] | section.get(nullable_opt, {})
+    return opts
+
+
+def validate_config_object(config_object):
+    """
+    Checks the modules: section of a generate.yaml, including that every header exists, so that
+    a malformed config can be rejected before any header is read. Returns the list of problems.
+    """
+
+    def is_str_list(value):
+        return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+    def check_opts(errors, module, section):
+        for opt in _LIST_OPTS_FROM_YAML:
+            if opt in section and not is_str_list(section[opt]):
+                errors.append(f"{module}: {opt} must be a list of strings")
+        nullable_opt = "fn_params_optional_with_default_null"
+        if nullable_opt in section:
+            nullable = section[nullable_opt]
+            if not isinstance(nullable, dict) or not all(
+                is_str_list(params) for params in nullable.values()
+            ):
+                errors.append(
+                    f"{module}: {nullable_opt} must map function names to lists of parameter names"
+                )
+
+    opt_keys = set(_LIST_OPTS_FROM_YAML) | {"fn_params_optional_with_default_null"}
+    module_keys = opt_keys | {"headers", "path"}
+
+    if not isinstance(config_object, dict):
+        return ["modules: must map module names to their settings"]
+
+    errors = []
+    for module, section in config_object.items():
+        if module == "all":
+            # The all section may be left empty
+            if not section:
+                continue
+            allowed_keys = opt_keys
+        else:
+            allowed_keys = module_keys
+        if not isinstance(section, dict):
+            errors.append(f"{module}: must map setting names to values")
+            continue
+
+        for key in section:
+            if key not in allowed_keys:
+                errors.append(f"{module}: unknown setting {key}")
+        check_opts(errors, module, section)
+
+        if module == "all":
+            continue
+        if "path" in section and not isinstance(section["path"], str):
+            errors.append(f"{module}: path must be a string")
+        headers = section.get("headers")
+        if not is_str_list(headers) or not headers:
+            errors.append(f"{module}: headers must be a non-empty list of header paths")
+            continue
+        for header in headers:
+            if not os.path.isfile(header):
+                errors.append(f"{module}: header {header} does not exist")
+
+    return errors
+
+
 def match_regex(regex_str: str, word: str) -> bool:
     if regex_str.startswith("|"):
         regex_str = regex_str[1:]